@@ -0,0 +1,124 @@
+import datetime
+from typing import List
+
+import pandas as pd
+
+from database.mongo import load_database
+from analysis.preprocess import preprocess
+from analysis.rolling import RollingMetrics
+from analysis.utilities import get_game_type
+
+AGGREGATIONS = ["sum", "mean", "std", "max", "min"]
+ROLLING_AGGREGATIONS = ["last n rounds", "last n days"]
+
+
+def load_ranked_games() -> pd.DataFrame:
+    """
+    :return: all ranked games with the team size of each round
+    """
+    return get_game_type(preprocess(load_database()))
+
+
+def filter_games(
+        ranked_games: pd.DataFrame,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        match_type: List[int]
+) -> pd.DataFrame:
+    """
+    get the games played between two dates for the selected team sizes
+    :param ranked_games:    all ranked games
+    :param start_date:      the start date of the query
+    :param end_date:        the end date of the query
+    :param match_type:      the team sizes to include
+    :return:                the games matching the query
+    """
+    ranked_games = ranked_games[
+        (ranked_games["matchTimestamp"] > start_date.strftime("%Y-%m-%d")) &
+        (ranked_games["matchTimestamp"] < end_date.strftime("%Y-%m-%d"))
+    ]
+
+    return ranked_games[ranked_games.team_size.isin(match_type)]
+
+
+def aggregate_games(
+        ranked_games: pd.DataFrame,
+        group_columns: List[str],
+        data_columns: List[str],
+        agg_func: str
+) -> pd.DataFrame:
+    """
+    aggregate the data columns for each group, along with the rounds played
+    and the win/loss ratio
+    :param ranked_games:    the games to aggregate
+    :param group_columns:   the columns to group on
+    :param data_columns:    the columns to aggregate
+    :param agg_func:        one of AGGREGATIONS
+    :return:                the aggregated games, indexed by the group columns
+    """
+    view_games = ranked_games.groupby(group_columns)[data_columns].agg(agg_func)
+    round_count = ranked_games.groupby(
+        group_columns).count()["team_size"].squeeze().astype(int).rename("rounds_played")
+    view_games = pd.concat([view_games, round_count], axis=1)
+    view_games = round(view_games, 2)
+
+    wins = ranked_games.groupby(group_columns)["result"].value_counts().loc[
+        ranked_games.groupby(
+            group_columns)["result"].value_counts().index.get_level_values(-1) == "Win"].droplevel(-1)
+    win_loss = round(wins.div(view_games["rounds_played"]), 2).rename("win_loss")
+
+    return pd.concat([view_games, win_loss.fillna(0.0)], axis=1)
+
+
+def build_rolling_metrics(ranked_games: pd.DataFrame, group_columns: List[str], match_type: List[int]) -> RollingMetrics:
+    """
+    :param ranked_games:    all ranked games
+    :param group_columns:   the columns to group on
+    :param match_type:      the team sizes to include
+    :return:                rolling metrics over every numeric column
+    """
+    games = ranked_games[ranked_games.team_size.isin(match_type)]
+    rolling = RollingMetrics(
+        group_columns=list(group_columns),
+        data_columns=sorted(games.columns[games.dtypes != object])
+    )
+    rolling.append(games)
+
+    return rolling
+
+
+def refresh_rolling_metrics(rolling: RollingMetrics, ranked_games: pd.DataFrame, match_type: List[int]) -> None:
+    """
+    add the rounds played since the rolling metrics were built or last refreshed,
+    only the new rounds are appended rather than rebuilding the history
+    :param rolling:         rolling metrics for the team sizes
+    :param ranked_games:    all ranked games, including the newly played ones
+    :param match_type:      the team sizes the rolling metrics were built for
+    """
+    since = str(pd.Timestamp(rolling.last_timestamp, unit="s"))
+    games = ranked_games[ranked_games["matchTimestamp"] >= since]
+    rolling.append(games[games.team_size.isin(match_type)])
+
+
+def rolling_games(
+        rolling: RollingMetrics,
+        agg_func: str,
+        window_size: int,
+        data_columns: List[str],
+        end_date: datetime.date
+) -> pd.DataFrame:
+    """
+    average the data columns over each group's most recent rounds or days
+    :param rolling:         rolling metrics for the selected groups and team sizes
+    :param agg_func:        one of ROLLING_AGGREGATIONS
+    :param window_size:     the number of rounds or days in the window
+    :param data_columns:    the columns to show
+    :param end_date:        only rounds played before the end date are used
+    :return:                the window averages, indexed by the group columns
+    """
+    if agg_func == "last n rounds":
+        view_games = rolling.last_rounds(window_size, until=pd.Timestamp(end_date))
+    else:
+        view_games = rolling.last_days(window_size, until=pd.Timestamp(end_date))
+
+    return round(view_games[data_columns + ["rounds_played", "win_loss"]], 2)
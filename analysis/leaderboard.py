@@ -0,0 +1,279 @@
+import random
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import pandas as pd
+
+LEADERBOARD_PATH = "database/leaderboard.csv"
+
+
+class _Node:
+    """
+    a treap node, ordered by key and heap ordered by priority, size is the
+    number of nodes in the subtree
+    """
+    __slots__ = ("key", "priority", "size", "left", "right")
+
+    def __init__(self, key: Tuple[float, str]):
+        self.key = key
+        self.priority = random.random()
+        self.size = 1
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node is not None else 0
+
+
+def _update(node: _Node) -> _Node:
+    node.size = 1 + _size(node.left) + _size(node.right)
+    return node
+
+
+def _split(node: Optional[_Node], key: Tuple[float, str]) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """
+    :return: the nodes with keys less than key and the nodes with keys greater than or equal to key
+    """
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        return _update(node), right
+    left, node.left = _split(node.left, key)
+    return left, _update(node)
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    """
+    :return: the two treaps joined, every key in left must be less than every key in right
+    """
+    if left is None or right is None:
+        return left if left is not None else right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return _update(left)
+    right.left = _merge(left, right.left)
+    return _update(right)
+
+
+class Leaderboard:
+    """
+    players ranked by elo, only players with more than min_matches matches
+    played are eligible, ranks, top k and neighbours take logarithmic time
+    """
+
+    def __init__(self, min_matches: int = 15):
+
+        self.min_matches = min_matches
+        self.ratings: Dict[str, float] = {}
+        self.matches_played: Dict[str, int] = {}
+
+        self._root: Optional[_Node] = None
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def __contains__(self, player: str) -> bool:
+        return self._is_eligible(player)
+
+    def _is_eligible(self, player: str) -> bool:
+        return player in self.ratings and self.matches_played.get(player, 0) > self.min_matches
+
+    def _key(self, player: str) -> Tuple[float, str]:
+        return -self.ratings[player], player
+
+    def _insert(self, player: str) -> None:
+        key = self._key(player)
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key)), right)
+
+    def _remove(self, player: str) -> None:
+        key = self._key(player)
+        left, right = _split(self._root, key)
+        _, right = _split(right, (key[0], key[1] + "\0"))
+        self._root = _merge(left, right)
+
+    def set_rating(self, player: str, rating: float) -> None:
+        """
+        :param player:  the player whose rating changed
+        :param rating:  the new rating
+        """
+        eligible = self._is_eligible(player)
+        if eligible:
+            self._remove(player)
+
+        self.ratings[player] = float(rating)
+
+        if eligible:
+            self._insert(player)
+        else:
+            self.matches_played.setdefault(player, 0)
+            if self._is_eligible(player):
+                self._insert(player)
+
+    def add_matches(self, players: Iterable[str], matches: int = 1) -> None:
+        """
+        :param players: the players that finished a match
+        :param matches: the number of matches to add
+        """
+        for player in players:
+            eligible = self._is_eligible(player)
+            self.matches_played[player] = self.matches_played.get(player, 0) + matches
+            if not eligible and self._is_eligible(player):
+                self._insert(player)
+
+    def _iterate(self, start: int) -> Iterator[str]:
+        """
+        :param start:   the zero based position to start at
+        :return:        players in rank order from that position
+        """
+        stack = []
+        node = self._root
+        while node is not None:
+            left_size = _size(node.left)
+            if start < left_size:
+                stack.append(node)
+                node = node.left
+            elif start == left_size:
+                stack.append(node)
+                break
+            else:
+                start -= left_size + 1
+                node = node.right
+
+        while stack:
+            node = stack.pop()
+            yield node.key[1]
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    def _ranked(self, start: int, stop: int) -> pd.Series:
+        """
+        :return: the elo of the players between two zero based positions
+        """
+        players = []
+        for player in self._iterate(max(start, 0)):
+            if len(players) >= stop - max(start, 0):
+                break
+            players.append(player)
+
+        return pd.Series([self.ratings[player] for player in players], index=players, dtype=float)
+
+    def top(self, k: int = 10) -> pd.Series:
+        """
+        :param k:   the number of players
+        :return:    the elo of the k highest rated eligible players
+        """
+        return self._ranked(0, k)
+
+    def rank(self, player: str) -> Optional[int]:
+        """
+        :param player:  the player to rank
+        :return:        the one based rank of the player, None if they aren't eligible
+        """
+        if not self._is_eligible(player):
+            return None
+
+        key = self._key(player)
+        rank = 0
+        node = self._root
+        while node is not None:
+            if key < node.key:
+                node = node.left
+            else:
+                rank += _size(node.left) + 1
+                if key == node.key:
+                    return rank
+                node = node.right
+
+        return None
+
+    def _count_before(self, key: Tuple[float, str]) -> int:
+        """
+        :return: the number of eligible players with keys less than key
+        """
+        count = 0
+        node = self._root
+        while node is not None:
+            if node.key < key:
+                count += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+
+        return count
+
+    def percentile(self, player: str) -> Optional[float]:
+        """
+        :param player:  the player to get the percentile for
+        :return:        the percentage of eligible players rated at or below the player,
+                        players with the same rating share a percentile
+        """
+        if not self._is_eligible(player):
+            return None
+
+        rated_above = self._count_before((-self.ratings[player], ""))
+
+        return 100.0 * (len(self) - rated_above) / len(self)
+
+    def neighbors(self, player: str, n: int = 5) -> pd.Series:
+        """
+        :param player:  the player to centre on
+        :param n:       the number of players either side
+        :return:        the elo of the players ranked around the player
+        """
+        rank = self.rank(player)
+        if rank is None:
+            return pd.Series(dtype=float)
+
+        return self._ranked(rank - 1 - n, rank + n)
+
+    def save(self, path: str = LEADERBOARD_PATH) -> None:
+        """
+        persist the leaderboard in rank order, ineligible players follow without a rank
+        :param path:    the location of the leaderboard
+        """
+        ranked = list(self._iterate(0))
+        unranked = sorted(set(self.ratings).difference(ranked), key=lambda player: -self.ratings[player])
+        players = ranked + unranked
+
+        pd.DataFrame(
+            {
+                "rank": pd.array(list(range(1, len(ranked) + 1)) + [None] * len(unranked), dtype="Int64"),
+                "elo": [self.ratings[player] for player in players],
+                "matches_played": [self.matches_played.get(player, 0) for player in players],
+            },
+            index=pd.Index(players, name="name")
+        ).to_csv(path)
+
+    @classmethod
+    def load(cls, path: str = LEADERBOARD_PATH, min_matches: int = 15) -> "Leaderboard":
+        """
+        :param path:        the location of the leaderboard
+        :param min_matches: the matches a player must have played more than to be ranked
+        :return:            the persisted leaderboard, empty if there isn't one
+        """
+        try:
+            saved = pd.read_csv(path, index_col=0)
+        except FileNotFoundError:
+            return cls(min_matches=min_matches)
+
+        return cls.from_ratings(saved["elo"], saved["matches_played"], min_matches=min_matches)
+
+    @classmethod
+    def from_ratings(cls, elo: pd.Series, matches_played: pd.Series, min_matches: int = 15) -> "Leaderboard":
+        """
+        :param elo:             the elo of each player
+        :param matches_played:  the matches played by each player, missing players have played none
+        :param min_matches:     the matches a player must have played more than to be ranked
+        :return:                the leaderboard for the ratings
+        """
+        leaderboard = cls(min_matches=min_matches)
+
+        for player, rating in elo.items():
+            leaderboard.matches_played[player] = int(matches_played.get(player, 0))
+            leaderboard.set_rating(player, rating)
+
+        return leaderboard
@@ -0,0 +1,214 @@
+import argparse
+from typing import Iterator, Set, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.metrics import log_loss, roc_auc_score
+from sklearn.preprocessing import StandardScaler
+
+MODEL_VERSION = 3
+MODEL_PATH = "database/outcome_model.joblib"
+
+features = [
+    'roundDuration', 'damageDealt', 'damageDealtShields', 'damageDealtTempShields',
+    'damageDealtAuto', 'damageDealtPilot', 'damageDealtBlocked', 'critRateDealt',
+    'damageTaken', 'damageTakenShields', 'damageTakenTempShields', 'damageTakenAuto',
+    'damageTakenBlocked', 'critRateTaken', 'terminationDamage', 'coreFracEarned', 'coresUsed', 'batteriesPicked',
+    'batteriesToSelf', 'batteriesToAlly', 'batteriesToAllyPilot', 'shieldsGained', 'tempShieldsGained', 'healthWasted',
+    'shieldsWasted', 'timeAsTitan', 'timeAsPilot', 'avgDistanceToAllies', 'avgDistanceToCloseAlly',
+    'avgDistanceToEnemies', 'avgDistanceToCloseEnemy', 'avgDistanceToAlliesPilot', 'avgDistanceToCloseAllyPilot',
+    'avgDistanceToEnemiesPilot', 'avgDistanceToCloseEnemyPilot', 'distanceTravelled', 'distanceTravelledPilot',
+    'damageDealtSelf', 'kills', 'killsPilot', 'terminations'
+]
+
+
+def feature_batches(games: pd.DataFrame, batch_size: int) -> Iterator[np.ndarray]:
+    """
+    split the feature matrix into float32 batches so that the whole history
+    never has to be held in memory as float64
+    :param games:       one row per player per round
+    :param batch_size:  the number of rows in each batch
+    :return:            the features for each batch
+    """
+    for start in range(0, len(games), batch_size):
+        yield games.iloc[start:start + batch_size][features].to_numpy(dtype=np.float32, na_value=0.0)
+
+
+class RoundOutcomeModel:
+    """
+    the probability of a player winning a round given their stats, trained
+    incrementally so only rounds that haven't been seen before are used to
+    update the model
+    """
+
+    def __init__(self):
+
+        self.version = MODEL_VERSION
+        self.sklearn_version = sklearn.__version__
+        self.features = list(features)
+        self.trained_until = ""
+        self.trained_rounds: Set[Tuple] = set()
+        self.rounds_seen = 0
+
+        self.scaler = StandardScaler()
+        self.classifier = SGDClassifier(loss="log_loss", average=True, random_state=0)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "RoundOutcomeModel":
+        """
+        load the persisted model, a new model is returned if there isn't one, if
+        it can't be read or if it was saved by a different version, with a
+        different scikit-learn or with different features
+        :param path:    the location of the persisted model
+        :return:        the outcome model
+        """
+        try:
+            model = joblib.load(path)
+        except FileNotFoundError:
+            return cls()
+        except Exception as e:
+            print("could not load outcome model, retraining from scratch")
+            print(e)
+            return cls()
+
+        if (
+                getattr(model, "version", None) != MODEL_VERSION or
+                getattr(model, "sklearn_version", None) != sklearn.__version__ or
+                model.features != features
+        ):
+            print("outdated outcome model, retraining from scratch")
+            return cls()
+
+        return model
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        """
+        :param path:    the location to persist the model to
+        """
+        joblib.dump(self, path)
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.rounds_seen > 0
+
+    def update(self, games: pd.DataFrame, batch_size: int = 10000, epochs: int = 5) -> None:
+        """
+        train on the rounds played since the model was last updated, draws are
+        ignored, rows arrive sorted by time so they are shuffled before every
+        pass, only the row positions are shuffled and each batch is sliced from
+        games as it is needed, so the new rounds are never copied in one go
+        :param games:       all ranked games
+        :param batch_size:  the number of rows in each batch
+        :param epochs:      the number of passes over the new rounds
+        """
+        timestamps = games['matchTimestamp']
+        is_new = (timestamps > self.trained_until).to_numpy()
+
+        if self.trained_rounds:
+            at_boundary = (timestamps == self.trained_until).to_numpy()
+            already_seen = pd.MultiIndex.from_frame(games[['matchID', 'round']]).isin(list(self.trained_rounds))
+            is_new = is_new | (at_boundary & ~already_seen)
+
+        new_rounds = np.flatnonzero(is_new)
+        positions = new_rounds[(games['result'].to_numpy()[new_rounds] != 'Draw')]
+        if not len(positions):
+            return
+
+        columns = games.columns.get_indexer(features)
+        wins = (games['result'].to_numpy()[positions] == 'Win').astype(int)
+
+        def batch(rows: np.ndarray) -> np.ndarray:
+            return games.iloc[positions[rows], columns].to_numpy(dtype=np.float32, na_value=0.0)
+
+        for start in range(0, len(positions), batch_size):
+            self.scaler.partial_fit(batch(np.arange(start, min(start + batch_size, len(positions)))))
+
+        shuffle = np.random.default_rng(self.rounds_seen)
+        for _ in range(epochs):
+            order = shuffle.permutation(len(positions))
+            for start in range(0, len(positions), batch_size):
+                rows = order[start:start + batch_size]
+                self.classifier.partial_fit(self.scaler.transform(batch(rows)), wins[rows], classes=[0, 1])
+
+        self.rounds_seen += len(positions)
+
+        # remember the rounds at the latest timestamp so that rounds arriving later with
+        # the same timestamp are trained on but the ones already seen are not
+        new_timestamps = timestamps.to_numpy()[new_rounds]
+        latest = new_timestamps.max()
+        if latest > self.trained_until:
+            self.trained_until = latest
+            self.trained_rounds = set()
+        at_latest = new_rounds[new_timestamps == latest]
+        self.trained_rounds.update(zip(games['matchID'].to_numpy()[at_latest], games['round'].to_numpy()[at_latest]))
+
+    def predict_proba(self, games: pd.DataFrame, batch_size: int = 10000) -> np.ndarray:
+        """
+        score rounds in batches
+        :param games:       one row per player per round
+        :param batch_size:  the number of rows in each batch
+        :return:            the probability of each row being a win
+        """
+        if not self.is_fitted:
+            return np.full(len(games), 0.5)
+
+        probabilities = [
+            self.classifier.predict_proba(self.scaler.transform(x))[:, 1]
+            for x in feature_batches(games, batch_size)
+        ]
+
+        return np.concatenate(probabilities) if probabilities else np.zeros(0)
+
+
+def evaluate(games: pd.DataFrame, holdout_fraction: float = 0.2) -> pd.DataFrame:
+    """
+    compare the incremental model with the logistic regression it replaced,
+    both are trained on the earlier rounds and scored on the latest ones
+    :param games:               all ranked games
+    :param holdout_fraction:    the fraction of rows, latest first, to score on
+    :return:                    holdout log loss and AUC for each model
+    """
+    games = games[games['result'] != 'Draw'].sort_values('matchTimestamp', kind="stable")
+    split = games['matchTimestamp'].iloc[int(len(games) * (1 - holdout_fraction))]
+    train, holdout = games[games['matchTimestamp'] < split], games[games['matchTimestamp'] >= split]
+
+    model = RoundOutcomeModel()
+    model.update(train)
+
+    logistic = LogisticRegression()
+    logistic.fit(train[features].fillna(0.0), train['result'] == 'Win')
+
+    won = holdout['result'] == 'Win'
+    probabilities = {
+        "outcome model": model.predict_proba(holdout),
+        "logistic regression": logistic.predict_proba(holdout[features].fillna(0.0))[:, 1],
+    }
+
+    return pd.DataFrame(
+        {
+            name: {"log_loss": log_loss(won, prob_win), "auc": roc_auc_score(won, prob_win)}
+            for name, prob_win in probabilities.items()
+        }
+    ).T
+
+
+if __name__ == "__main__":
+
+    from analysis.explorer import load_ranked_games
+
+    parser = argparse.ArgumentParser(description="train the outcome model on the full ranked history and save it")
+    parser.add_argument("--evaluate", action="store_true", help="compare against logistic regression on a holdout")
+    args = parser.parse_args()
+
+    ranked_games = load_ranked_games()
+
+    if args.evaluate:
+        print(evaluate(ranked_games))
+
+    outcome_model = RoundOutcomeModel.load()
+    outcome_model.update(ranked_games)
+    outcome_model.save()
+    print("outcome model trained on {} rounds up to {}".format(outcome_model.rounds_seen, outcome_model.trained_until))
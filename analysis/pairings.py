@@ -0,0 +1,150 @@
+import datetime
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+RELATIONS = ["teammates", "opponents"]
+
+
+class Pairings:
+    """
+    sparse co-occurrence and win counts for every pair of players or titans,
+    stored per day and team size so that queries can be sliced the same way
+    as the explorer, for teammates the pair was on the same team and for
+    opponents the pair was on opposing teams, wins are from the first of the pair
+    """
+
+    def __init__(self, column: str):
+
+        self.column = column
+        self.entities = pd.Index([], dtype=object)
+        self.buckets: Dict[Tuple[str, int], Dict[str, sparse.csr_matrix]] = {}
+        self.last_timestamp = ""
+        self.last_rounds: Set[Tuple] = set()
+
+    def append(self, games: pd.DataFrame) -> None:
+        """
+        add newly played rounds in a single pass
+        :param games:   one row per player per round, with the team size of each round, rounds
+                        older than the ones already added or already counted are ignored
+        """
+        round_keys = pd.MultiIndex.from_frame(games[['matchID', 'round']])
+        outdated = (games['matchTimestamp'] < self.last_timestamp).to_numpy() | (
+            (games['matchTimestamp'] == self.last_timestamp).to_numpy() & round_keys.isin(list(self.last_rounds))
+        )
+        if outdated.any():
+            print("ignoring {} outdated rows".format(outdated.sum()))
+            games = games[~outdated]
+
+        if games.empty:
+            return
+
+        latest = games['matchTimestamp'].max()
+        if latest > self.last_timestamp:
+            self.last_timestamp = latest
+            self.last_rounds = set()
+        at_latest = games[games['matchTimestamp'] == latest]
+        self.last_rounds.update(zip(at_latest['matchID'], at_latest['round']))
+
+        new_entities = pd.Index(games[self.column].unique()).difference(self.entities)
+        self.entities = self.entities.append(new_entities)
+
+        games = games.assign(win=games['result'] == 'Win', day=games['matchTimestamp'].str[:10])
+        sides = games.groupby(['matchID', 'round', 'team'], sort=True)
+        side_codes = sides.ngroup().to_numpy()
+        side_info = sides.agg(
+            win=('win', 'any'),
+            day=('day', 'first'),
+            team_size=('team_size', 'first'),
+        ).reset_index()
+
+        # sides are sorted by match, round then team, so opposing teams are next to each other
+        round_codes = side_info.groupby(['matchID', 'round']).ngroup().to_numpy()
+        first_side = np.searchsorted(round_codes, round_codes)
+        has_opponent = np.bincount(round_codes)[round_codes] == 2
+        opponent = np.where(first_side == np.arange(len(side_info)), first_side + 1, first_side)
+
+        incidence = sparse.csr_matrix(
+            (np.ones(len(games)), (side_codes, self.entities.get_indexer(games[self.column]))),
+            shape=(len(side_info), len(self.entities))
+        )
+        wins = side_info['win'].to_numpy(dtype=float)
+
+        for (day, team_size), bucket in side_info.groupby(['day', 'team_size']).groups.items():
+            rows = bucket.to_numpy()
+            own = incidence[rows]
+            won = sparse.diags(wins[rows]) @ own
+
+            facing = rows[has_opponent[rows]]
+            against_own = incidence[facing]
+            against_other = incidence[opponent[facing]]
+            against_won = sparse.diags(wins[facing]) @ against_own
+
+            self._add((day, int(team_size)), {
+                "teammates": own.T @ own,
+                "teammates_wins": won.T @ own,
+                "opponents": against_own.T @ against_other,
+                "opponents_wins": against_won.T @ against_other,
+            })
+
+    def _add(self, key: Tuple[str, int], counts: Dict[str, sparse.csr_matrix]) -> None:
+        """
+        :param key:     the day and team size
+        :param counts:  the pair counts to add to the bucket
+        """
+        if key not in self.buckets:
+            self.buckets[key] = {name: sparse.csr_matrix(matrix) for name, matrix in counts.items()}
+            return
+
+        for name, matrix in counts.items():
+            total = self.buckets[key][name]
+            total.resize(matrix.shape)
+            self.buckets[key][name] = total + matrix
+
+    def query(
+            self,
+            relation: str,
+            start_date: datetime.date,
+            end_date: datetime.date,
+            match_type: List[int],
+            rounds_min: int = 0
+    ) -> pd.DataFrame:
+        """
+        :param relation:    one of RELATIONS
+        :param start_date:  the start date of the query
+        :param end_date:    the end date of the query
+        :param match_type:  the team sizes to include
+        :param rounds_min:  pairs must have played more rounds than this
+        :return:            rounds played and win/loss for each pair
+        """
+        shape = (len(self.entities), len(self.entities))
+        rounds_played = sparse.csr_matrix(shape)
+        wins = sparse.csr_matrix(shape)
+
+        start, end = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+        for (day, team_size), counts in self.buckets.items():
+            if start <= day < end and team_size in match_type:
+                for matrix in counts.values():
+                    matrix.resize(shape)
+                rounds_played = rounds_played + counts[relation]
+                wins = wins + counts[relation + "_wins"]
+
+        rounds_played = rounds_played.tocoo()
+        keep = rounds_played.data > rounds_min
+        if relation == "teammates":
+            keep &= rounds_played.row != rounds_played.col
+
+        rows, cols = rounds_played.row[keep], rounds_played.col[keep]
+        pair_wins = np.asarray(wins.tocsr()[rows, cols]).ravel() if len(rows) else np.zeros(0)
+
+        view_pairs = pd.DataFrame({
+            self.column: self.entities[rows],
+            "teammate" if relation == "teammates" else "opponent": self.entities[cols],
+            "rounds_played": rounds_played.data[keep].astype(int),
+            "wins": pair_wins.astype(int),
+        })
+        view_pairs["win_loss"] = round(view_pairs["wins"].div(view_pairs["rounds_played"]), 2)
+
+        return view_pairs.sort_values("rounds_played", ascending=False, ignore_index=True)
@@ -1,6 +1,9 @@
 import itertools
+import os
 import pandas as pd
 
+from analysis.leaderboard import Leaderboard, LEADERBOARD_PATH
+
 
 def get_result(p1, p2) -> float:
     """
@@ -12,13 +15,14 @@ def get_result(p1, p2) -> float:
     return 1 / ((10.0 ** exponent) + 1)
 
 
-def update_elo(game_round: pd.DataFrame, k: int, g: int) -> pd.Series:
+def update_elo(game_round: pd.DataFrame, k: int, g: int, leaderboard: Leaderboard) -> pd.Series:
     """
     update the elo for each player in the game round
     :param game_round:      the game round to update the elo for
     :param elo:             the current elo for each player
     :param k:               the k factor for the elo
     :param g:               the g factor for the elo
+    :param leaderboard:     the leaderboard to update, the caller saves it
     :return:                the updated elo for each player
     """
     try:
@@ -53,6 +57,9 @@ def update_elo(game_round: pd.DataFrame, k: int, g: int) -> pd.Series:
     elo = elo.rename(game_round.matchTimestamp.unique()[0])
     elo.to_csv("database/elo.csv")
 
+    for player in winners + losers:
+        leaderboard.set_rating(player, elo[player])
+
     try:
         timeseries_elo = pd.read_csv("database/timeseries_elo.csv", index_col=0)
         timeseries_elo = pd.concat([timeseries_elo, elo], axis=1)
@@ -64,6 +71,32 @@ def update_elo(game_round: pd.DataFrame, k: int, g: int) -> pd.Series:
     return elo
 
 
+def load_leaderboard(games: pd.DataFrame, save: bool = True) -> Leaderboard:
+    """
+    load the saved leaderboard, if there isn't one it is rebuilt from elo.csv
+    with the matches played counted from the games already rated
+    :param games:   all ranked games
+    :param save:    save the rebuilt leaderboard, readers that don't own the file should not
+    :return:        the leaderboard
+    """
+    if os.path.exists(LEADERBOARD_PATH):
+        return Leaderboard.load()
+
+    try:
+        elo = pd.read_csv("database/elo.csv", index_col=0).squeeze("columns")
+    except FileNotFoundError:
+        elo = pd.Series(dtype=float, name="2021-03-01")
+
+    rated_games = games[games['matchTimestamp'] <= elo.name]
+    matches_played = rated_games.groupby('name')['matchID'].nunique()
+
+    leaderboard = Leaderboard.from_ratings(elo, matches_played)
+    if save:
+        leaderboard.save()
+
+    return leaderboard
+
+
 def trigger_update(games: pd.DataFrame) -> None:
     """
     :param games:
@@ -74,6 +107,8 @@ def trigger_update(games: pd.DataFrame) -> None:
     except FileNotFoundError:
         elo = pd.Series(dtype=float, name="2021-03-01")
 
+    leaderboard = load_leaderboard(games)
+
     games = games[games['matchTimestamp'] > elo.name]
     chronological_matches = games.sort_values("matchTimestamp", ascending=True).matchID.unique()
 
@@ -86,6 +121,10 @@ def trigger_update(games: pd.DataFrame) -> None:
             update_elo(
                 match_played[match_played["round"] == round_played],
                 k=8,
-                g=1
+                g=1,
+                leaderboard=leaderboard
             )
 
+        leaderboard.add_matches(match_played["name"].unique())
+        leaderboard.save()
+
@@ -0,0 +1,198 @@
+from typing import List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class RollingMetrics:
+    """
+    rolling "recent form" windows for each group (player, player and titan etc),
+    rows are stored as cumulative sums so that any window is the difference of
+    two rows
+
+    appended rows go into a new segment sorted by group then time, segments are
+    merged once the newer one is as large as the one before it, so there are
+    only logarithmically many and an append never copies the whole history
+    """
+
+    def __init__(self, group_columns: List[str], data_columns: List[str]):
+
+        self.group_columns = list(group_columns)
+        self.data_columns = list(data_columns)
+
+        self.groups = pd.MultiIndex.from_arrays([[]] * len(self.group_columns), names=self.group_columns)
+        self.totals = np.zeros((0, len(self.data_columns) + 1))
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.last_timestamp = 0
+        self.boundary_rounds: Set[Tuple] = set()
+
+        # each segment holds the (group, time) keys, the (group, round number) keys and the cumulative sums
+        self._segments: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+
+    def append(self, games: pd.DataFrame) -> None:
+        """
+        add newly played rounds, the cumulative sums already stored are extended
+        rather than being recomputed
+        :param games:   one row per player per round, rounds older than the ones
+                        already added or already counted are ignored
+        """
+        games = games[games['matchTimestamp'].notna()]
+        timestamps = pd.to_datetime(games['matchTimestamp']).values.astype('datetime64[s]').astype(np.int64)
+
+        round_keys = pd.MultiIndex.from_frame(games[['matchID', 'round']])
+        outdated = (timestamps < self.last_timestamp) | (
+            (timestamps == self.last_timestamp) & round_keys.isin(list(self.boundary_rounds))
+        )
+        if outdated.any():
+            print("ignoring {} outdated rows".format(outdated.sum()))
+            games = games[~outdated]
+            timestamps = timestamps[~outdated]
+
+        if games.empty:
+            return
+
+        latest = int(timestamps.max())
+        if latest > self.last_timestamp:
+            self.last_timestamp = latest
+            self.boundary_rounds = set()
+        at_latest = games[timestamps == latest]
+        self.boundary_rounds.update(zip(at_latest['matchID'], at_latest['round']))
+
+        new_groups = pd.MultiIndex.from_frame(games[self.group_columns]).unique().difference(self.groups)
+        if len(new_groups):
+            self.groups = self.groups.append(new_groups)
+            self.totals = np.vstack([self.totals, np.zeros((len(new_groups), self.totals.shape[1]))])
+            self.counts = np.append(self.counts, np.zeros(len(new_groups), dtype=np.int64))
+
+        codes = self.groups.get_indexer(pd.MultiIndex.from_frame(games[self.group_columns]))
+        keys = self._encode(codes, timestamps)
+        order = np.argsort(keys, kind="stable")
+        codes = codes[order]
+
+        values = np.column_stack([
+            games[self.data_columns].astype(float).fillna(0.0).to_numpy(),
+            (games['result'] == 'Win').to_numpy(dtype=float)
+        ])[order]
+
+        by_group = pd.DataFrame(values).groupby(codes)
+        cumsum = by_group.cumsum().to_numpy() + self.totals[codes]
+        counts = by_group.cumcount().to_numpy() + 1 + self.counts[codes]
+
+        group_end = np.append(codes[1:] != codes[:-1], True)
+        self.totals[codes[group_end]] = cumsum[group_end]
+        self.counts[codes[group_end]] = counts[group_end]
+
+        self._segments.append((keys[order], self._encode(codes, counts), cumsum))
+        while len(self._segments) > 1 and len(self._segments[-2][0]) <= len(self._segments[-1][0]):
+            self._merge_last()
+
+    def _merge_last(self) -> None:
+        """
+        merge the two newest segments, the older rows stay first when keys are equal
+        """
+        newer = self._segments.pop()
+        older = self._segments.pop()
+
+        keys = np.concatenate([older[0], newer[0]])
+        order = np.argsort(keys, kind="stable")
+        self._segments.append((
+            keys[order],
+            np.concatenate([older[1], newer[1]])[order],
+            np.concatenate([older[2], newer[2]])[order]
+        ))
+
+    def last_rounds(self, rounds: int, until: pd.Timestamp = None) -> pd.DataFrame:
+        """
+        average of each data column over the most recent rounds for every group
+        :param rounds:  the number of rounds in the window
+        :param until:   only rounds played up to this time are used, defaults to every round added
+        :return:        window averages, rounds_played and win_loss for each group
+        """
+        if rounds < 1:
+            raise ValueError("rounds must be at least 1")
+
+        if until is None:
+            last = self.counts
+        else:
+            last = self._count(self._seconds(until), side='right')
+
+        return self._window(np.maximum(last - rounds, 0), last)
+
+    def last_days(self, days: int, until: pd.Timestamp = None) -> pd.DataFrame:
+        """
+        average of each data column over a number of days for every group
+        :param days:    the number of days in the window
+        :param until:   the end of the window, defaults to the latest round added
+        :return:        window averages, rounds_played and win_loss for each group
+        """
+        if days < 1:
+            raise ValueError("days must be at least 1")
+
+        end = self.last_timestamp if until is None else self._seconds(until)
+        start = max(end - days * 24 * 60 * 60, 0)
+
+        return self._window(self._count(start, side='left'), self._count(end, side='right'))
+
+    def _count(self, timestamp: int, side: str) -> np.ndarray:
+        """
+        :param timestamp:   seconds since epoch
+        :param side:        'right' counts rounds played up to and including the time, 'left' only those before
+        :return:            the number of rounds played by each group
+        """
+        codes = np.arange(len(self.groups))
+        counts = np.zeros(len(codes), dtype=np.int64)
+        for keys, _, _ in self._segments:
+            counts += np.searchsorted(keys, self._encode(codes, timestamp), side=side)
+            counts -= np.searchsorted(keys, self._encode(codes, 0), side='left')
+
+        return counts
+
+    def _cumulative(self, counts: np.ndarray) -> np.ndarray:
+        """
+        :param counts:  a number of rounds for each group
+        :return:        the cumulative sums after that many rounds, zero for no rounds
+        """
+        wanted = self._encode(np.arange(len(self.groups)), counts)
+        cumulative = np.zeros(self.totals.shape)
+        for _, count_keys, cumsum in self._segments:
+            positions = np.minimum(np.searchsorted(count_keys, wanted), len(count_keys) - 1)
+            found = count_keys[positions] == wanted
+            cumulative[found] = cumsum[positions[found]]
+
+        return cumulative
+
+    def _window(self, start: np.ndarray, end: np.ndarray) -> pd.DataFrame:
+        """
+        :param start:   the number of rounds each group played before the window
+        :param end:     the number of rounds each group played by the end of the window
+        :return:        window averages, rounds_played and win_loss for each group
+        """
+        window = self._cumulative(end) - self._cumulative(start)
+
+        rounds_played = end - start
+        with np.errstate(divide="ignore", invalid="ignore"):
+            averages = window / rounds_played[:, None]
+
+        view_games = pd.DataFrame(averages[:, :-1], index=self.groups, columns=self.data_columns)
+        view_games["rounds_played"] = rounds_played
+        view_games["win_loss"] = averages[:, -1]
+
+        return view_games[view_games["rounds_played"] > 0]
+
+    @staticmethod
+    def _seconds(timestamp: pd.Timestamp) -> int:
+        """
+        :param timestamp:   a point in time
+        :return:            seconds since epoch, clamped to the range the keys can hold
+        """
+        return min(max(int(pd.Timestamp(timestamp).timestamp()), 0), 2 ** 32 - 1)
+
+    @staticmethod
+    def _encode(codes: np.ndarray, values) -> np.ndarray:
+        """
+        pack the group and a timestamp or round number into a single sortable key
+        :param codes:   the group code for each row
+        :param values:  seconds since epoch or round numbers for each row
+        :return:        group in the high bits, the value in the low bits
+        """
+        return (np.asarray(codes, dtype=np.int64) << 32) | np.asarray(values, dtype=np.int64)
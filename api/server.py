@@ -0,0 +1,532 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pandas as pd
+
+from analysis.explorer import (
+    AGGREGATIONS, ROLLING_AGGREGATIONS, load_ranked_games, filter_games, aggregate_games, build_rolling_metrics,
+    refresh_rolling_metrics, rolling_games
+)
+from analysis.leaderboard import Leaderboard, LEADERBOARD_PATH
+from analysis.ranked import load_leaderboard
+from analysis.rolling import RollingMetrics
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+REQUEST_TIMEOUT = 10
+
+
+class QueryError(ValueError):
+    """
+    raised when a request has missing or invalid parameters
+    """
+
+
+class NotFoundError(QueryError):
+    """
+    raised when a request refers to something that doesn't exist
+    """
+
+
+def to_records(view_games: pd.DataFrame) -> list:
+    """
+    :param view_games:  the frame to serialise, the index is included as columns
+    :return:            a json compatible list of rows, NaN becomes null
+    """
+    return json.loads(view_games.reset_index().to_json(orient="records"))
+
+
+# state of a worker process, set when it starts, with the fork start method
+# the ranked games are shared copy-on-write with the server process
+_ranked_games: Optional[pd.DataFrame] = None
+_rolling: OrderedDict = OrderedDict()
+_rolling_cache_size = 4
+
+
+def _init_worker(ranked_games: pd.DataFrame, rolling_cache_size: int) -> None:
+    """
+    :param ranked_games:        all ranked games
+    :param rolling_cache_size:  the number of rolling metrics kept by the worker
+    """
+    global _ranked_games, _rolling_cache_size
+    _ranked_games = ranked_games
+    _rolling_cache_size = rolling_cache_size
+
+
+def _worker_loop(connection: Connection, ranked_games: pd.DataFrame, rolling_cache_size: int) -> None:
+    """
+    run the functions sent by the server one at a time and send back their
+    results, until the server closes the connection
+    :param connection:          the worker's end of the pipe
+    :param ranked_games:        all ranked games
+    :param rolling_cache_size:  the number of rolling metrics kept by the worker
+    """
+    _init_worker(ranked_games, rolling_cache_size)
+
+    while True:
+        try:
+            task_id, func, args = connection.recv()
+        except EOFError:
+            return
+
+        try:
+            connection.send((task_id, func(*args), None))
+        except QueryError as e:
+            connection.send((task_id, None, e))
+        except Exception as e:
+            connection.send((task_id, None, RuntimeError(str(e))))
+
+
+def _append_games(new_games: pd.DataFrame) -> None:
+    """
+    add the rounds played since the worker started, the cached rolling
+    metrics are extended with them rather than rebuilt
+    :param new_games:   the newly played rounds
+    """
+    global _ranked_games
+    _ranked_games = pd.concat([_ranked_games, new_games], ignore_index=True)
+
+    for (_, team_size), rolling in _rolling.items():
+        refresh_rolling_metrics(rolling, new_games, list(team_size))
+
+
+def _rolling_metrics(group_columns: Tuple[str, ...], team_size: Tuple[int, ...]) -> RollingMetrics:
+    """
+    :return: the worker's rolling metrics for the groups and team sizes, least recently used are evicted
+    """
+    rolling_key = (group_columns, team_size)
+    if rolling_key in _rolling:
+        _rolling.move_to_end(rolling_key)
+        return _rolling[rolling_key]
+
+    _rolling[rolling_key] = build_rolling_metrics(_ranked_games, list(group_columns), list(team_size))
+    if len(_rolling) > _rolling_cache_size:
+        _rolling.popitem(last=False)
+
+    return _rolling[rolling_key]
+
+
+def _query(key: Tuple) -> dict:
+    """
+    the explorer query, runs in a worker process
+    :param key: the normalised query
+    :return:    the aggregated rows
+    """
+    _, start_date, end_date, team_size, group_columns, data_columns, agg_func, window_size, min_rounds = key
+
+    if agg_func in ROLLING_AGGREGATIONS:
+        view_games = rolling_games(
+            _rolling_metrics(group_columns, team_size), agg_func, window_size, list(data_columns), end_date
+        )
+    else:
+        games = filter_games(_ranked_games, start_date, end_date, list(team_size))
+        view_games = aggregate_games(games, list(group_columns), list(data_columns), agg_func)
+
+    view_games = view_games[view_games["rounds_played"] > min_rounds]
+
+    return {"rows": to_records(view_games)}
+
+
+def _player(name: str) -> dict:
+    """
+    the player's results, runs in a worker process
+    :param name:    the player name
+    :return:        rounds played, win/loss and per titan results
+    """
+    games = _ranked_games[_ranked_games["name"] == name]
+    if games.empty:
+        raise NotFoundError("unknown player {}".format(name))
+
+    titans = aggregate_games(games, ["titan"], ["damageDealt"], "mean")
+
+    return {
+        "rounds_played": len(games),
+        "win_loss": round(float((games["result"] == "Win").mean()), 2),
+        "titans": to_records(titans),
+    }
+
+
+class ExplorerService:
+    """
+    the Stats Explorer engine without streamlit, aggregations run in worker
+    processes so they never hold the event loop's GIL, identical queries that
+    are in flight are coalesced and finished queries are cached
+
+    every worker process is started before the server creates any thread and
+    answers over its own pipe, which the event loop reads, queries needing the
+    same rolling metrics always go to the same worker so they are built once
+    and kept in that worker's bounded cache, other queries go to the least busy
+    worker
+
+    when the rating engine saves a new leaderboard it is reloaded along with
+    the games played since, which are sent to every worker
+    """
+
+    def __init__(
+            self,
+            ranked_games: pd.DataFrame,
+            leaderboard: Leaderboard,
+            workers: int = 4,
+            cache_size: int = 256,
+            rolling_cache_size: int = 4
+    ):
+
+        self.ranked_games = ranked_games
+        self.leaderboard = leaderboard
+        self.leaderboard_mtime = self._leaderboard_mtime()
+        self.reloading = False
+        self.reload_task: Optional[asyncio.Future] = None
+        self.team_sizes = sorted(ranked_games.team_size.unique())
+        self.columns = set(ranked_games.columns)
+        self.data_columns = set(ranked_games.columns[ranked_games.dtypes != object])
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.connections: List[Connection] = []
+        self.processes = []
+        for _ in range(workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=_worker_loop, args=(worker_connection, ranked_games, rolling_cache_size), daemon=True
+            )
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        self.pending = [0] * workers
+        self.task_ids = itertools.count()
+        self.tasks: Dict[int, Tuple[int, asyncio.Future]] = {}
+
+        self.cache_size = cache_size
+        self.cache: OrderedDict = OrderedDict()
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def start(self) -> None:
+        """
+        read the results sent by the workers, must be called from the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        for index, connection in enumerate(self.connections):
+            loop.add_reader(connection.fileno(), self._receive, index)
+
+    def _receive(self, index: int) -> None:
+        """
+        :param index:   the worker with a result ready to read
+        """
+        try:
+            task_id, result, error = self.connections[index].recv()
+        except EOFError:
+            asyncio.get_running_loop().remove_reader(self.connections[index].fileno())
+            for task_id, (worker, future) in list(self.tasks.items()):
+                if worker == index:
+                    self.tasks.pop(task_id)
+                    future.set_exception(RuntimeError("worker {} stopped".format(index)))
+            return
+
+        _, future = self.tasks.pop(task_id)
+        self.pending[index] -= 1
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def submit(self, index: int, func: Callable, *args) -> asyncio.Future:
+        """
+        :param index:   the worker to run the function on
+        :param func:    a module level function
+        :return:        the future result of the function
+        """
+        task_id = next(self.task_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.tasks[task_id] = (index, future)
+        self.pending[index] += 1
+        self.connections[index].send((task_id, func, args))
+
+        return future
+
+    async def run(self, key: Hashable, func: Callable, *args, shard: Hashable = None) -> Any:
+        """
+        run the function on a worker unless the result is cached or an
+        identical request is already being computed
+        :param key:     the normalised query
+        :param func:    the function computing the result
+        :param shard:   requests with the same shard always run on the same worker
+        :return:        the result of the function
+        """
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        if key not in self.in_flight:
+            if shard is None:
+                index = self.pending.index(min(self.pending))
+            else:
+                index = hash(shard) % len(self.connections)
+
+            future = self.submit(index, func, *args)
+            future.add_done_callback(lambda done: self._store(key, done))
+            self.in_flight[key] = future
+
+        return await asyncio.shield(self.in_flight[key])
+
+    def _store(self, key: Hashable, future: asyncio.Future) -> None:
+        """
+        :param key:     the normalised query
+        :param future:  the finished computation
+        """
+        if self.in_flight.get(key) is future:
+            self.in_flight.pop(key)
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        self.cache[key] = future.result()
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    @staticmethod
+    def _leaderboard_mtime() -> Optional[float]:
+        """
+        :return: when the leaderboard was last saved, None if it hasn't been
+        """
+        try:
+            return os.path.getmtime(LEADERBOARD_PATH)
+        except OSError:
+            return None
+
+    def check_reload(self) -> None:
+        """
+        start reloading if the rating engine has saved a new leaderboard since it was loaded
+        """
+        mtime = self._leaderboard_mtime()
+        if mtime is not None and mtime != self.leaderboard_mtime and not self.reloading:
+            self.reloading = True
+            self.reload_task = asyncio.ensure_future(self.reload(mtime))
+
+    async def reload(self, mtime: float) -> None:
+        """
+        reload the leaderboard and the games played since the last load, the
+        new games are appended in every worker and cached results are dropped
+        :param mtime:   the modification time of the leaderboard being loaded
+        """
+        try:
+            self.leaderboard = Leaderboard.load()
+            self.leaderboard_mtime = mtime
+            self.cache.clear()
+
+            ranked_games = await asyncio.get_running_loop().run_in_executor(None, load_ranked_games)
+
+            last_timestamp = self.ranked_games["matchTimestamp"].max()
+            at_boundary = self.ranked_games[self.ranked_games["matchTimestamp"] == last_timestamp]
+            round_keys = pd.MultiIndex.from_frame(ranked_games[["matchID", "round"]])
+            is_new = (ranked_games["matchTimestamp"] > last_timestamp).to_numpy() | (
+                (ranked_games["matchTimestamp"] == last_timestamp).to_numpy() &
+                ~round_keys.isin(list(zip(at_boundary["matchID"], at_boundary["round"])))
+            )
+            new_games = ranked_games[is_new]
+            self.ranked_games = ranked_games
+
+            if not new_games.empty:
+                await asyncio.gather(*(
+                    self.submit(index, _append_games, new_games) for index in range(len(self.connections))
+                ))
+                self.cache.clear()
+            print("reloaded the leaderboard and {} new rows".format(len(new_games)))
+        except Exception as e:
+            print("could not reload the leaderboard")
+            print(e)
+        finally:
+            self.reloading = False
+
+    def normalise_query(self, params: Dict[str, list]) -> Tuple:
+        """
+        parse the explorer query parameters into a hashable key, lists are sorted
+        so equivalent queries share a cache entry
+        :param params:  the parsed query string
+        :return:        the normalised query
+        """
+        def values(name: str) -> list:
+            return sorted({value for raw in params.get(name, []) for value in raw.split(",") if value})
+
+        try:
+            start_date = datetime.date.fromisoformat(params.get("start_date", ["2022-01-01"])[0])
+            end_date = datetime.date.fromisoformat(
+                params.get("end_date", [datetime.date.today().isoformat()])[0]
+            )
+            team_size = [int(size) for size in values("team_size")] or self.team_sizes
+            min_rounds = int(params.get("min_rounds", ["0"])[0])
+            window_size = int(params.get("window_size", ["50"])[0])
+        except ValueError as e:
+            raise QueryError(str(e))
+
+        group_columns = values("group_columns")
+        data_columns = values("data_columns")
+        agg_func = params.get("agg_func", ["mean"])[0]
+
+        if not group_columns or not data_columns:
+            raise QueryError("group_columns and data_columns are required")
+        if agg_func not in AGGREGATIONS + ROLLING_AGGREGATIONS:
+            raise QueryError("agg_func must be one of {}".format(AGGREGATIONS + ROLLING_AGGREGATIONS))
+
+        unknown = set(group_columns + data_columns).difference(self.columns)
+        if unknown:
+            raise QueryError("unknown columns {}".format(sorted(unknown)))
+
+        not_numeric = set(data_columns).difference(self.data_columns)
+        if not_numeric:
+            raise QueryError("data_columns must be numeric, got {}".format(sorted(not_numeric)))
+
+        if agg_func in ROLLING_AGGREGATIONS:
+            if window_size < 1:
+                raise QueryError("window_size must be at least 1")
+            start_date = None
+        else:
+            window_size = None
+
+        return (
+            "query", start_date, end_date, tuple(team_size), tuple(group_columns), tuple(data_columns),
+            agg_func, window_size, min_rounds
+        )
+
+    def top_players(self, k: int) -> dict:
+        """
+        :param k:   the number of players to return
+        :return:    the highest rated players
+        """
+        top = self.leaderboard.top(k).rename("elo").rename_axis("name").to_frame()
+        top.insert(0, "rank", range(1, len(top) + 1))
+
+        return {"rows": to_records(top)}
+
+    async def player(self, name: str) -> dict:
+        """
+        :param name:    the player name
+        :return:        the player's rating, rank and per titan results
+        """
+        results = await self.run(("player", name), _player, name)
+
+        return {
+            "name": name,
+            "elo": self.leaderboard.ratings.get(name),
+            "rank": self.leaderboard.rank(name),
+            "percentile": self.leaderboard.percentile(name),
+            **results,
+        }
+
+    async def handle(self, path: str, params: Dict[str, list]) -> Tuple[int, Any]:
+        """
+        route a request
+        :param path:    the request path
+        :param params:  the parsed query string
+        :return:        the status code and the json body
+        """
+        self.check_reload()
+
+        if path == "/query":
+            key = self.normalise_query(params)
+            shard = key[3:5] if key[6] in ROLLING_AGGREGATIONS else None
+            return 200, await self.run(key, _query, key, shard=shard)
+
+        if path == "/leaderboard":
+            try:
+                k = int(params.get("k", ["10"])[0])
+            except ValueError as e:
+                raise QueryError(str(e))
+            return 200, self.top_players(k)
+
+        if path.startswith("/player/"):
+            return 200, await self.player(unquote(path[len("/player/"):]))
+
+        return 404, {"error": "unknown endpoint {}".format(path)}
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> List[str]:
+        """
+        :param reader:  the client stream
+        :return:        the request line split into method, target and version, the headers are skipped
+        """
+        request_line = (await reader.readline()).decode("latin-1").split()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        return request_line
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        answer a single HTTP/1.1 GET request
+        :param reader:  the client stream
+        :param writer:  the response stream
+        """
+        try:
+            try:
+                request_line = await asyncio.wait_for(self.read_request(reader), REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                return
+
+            if len(request_line) < 2:
+                return
+
+            method, target = request_line[0], request_line[1]
+            url = urlsplit(target)
+
+            if method != "GET":
+                status, body = 405, {"error": "only GET is supported"}
+            else:
+                try:
+                    status, body = await self.handle(url.path, parse_qs(url.query))
+                except NotFoundError as e:
+                    status, body = 404, {"error": str(e)}
+                except QueryError as e:
+                    status, body = 400, {"error": str(e)}
+                except Exception as e:
+                    print("could not process request {}".format(target))
+                    print(e)
+                    status, body = 500, {"error": str(e)}
+
+            payload = json.dumps(body).encode()
+            writer.write(
+                "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                "Connection: close\r\n\r\n".format(status, STATUS_TEXT[status], len(payload)).encode() + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def main(host: str, port: int, workers: int) -> None:
+    """
+    load the ranked games and serve them until interrupted, they are reloaded
+    whenever the rating engine saves a new leaderboard
+    :param host:    the interface to listen on
+    :param port:    the port to listen on
+    :param workers: the number of worker processes for aggregations
+    """
+    ranked_games = load_ranked_games()
+    service = ExplorerService(ranked_games, load_leaderboard(ranked_games, save=False), workers=workers)
+    service.start()
+    server = await asyncio.start_server(service.serve_client, host, port)
+
+    print("serving stats on {}:{}".format(host, port))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="headless Stats Explorer API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.host, args.port, args.workers))
@@ -17,6 +17,7 @@ def load_database() -> pd.DataFrame:
         tlsAllowInvalidCertificates=True
     )
     games = pd.DataFrame(list(client["ranking"].ranking.find()))
+    client.close()
     games["team"] = games["team"].replace([2, 3], ["imc", "militia"])
 
     games['matchTimestamp'] = games['matchTimestamp'].apply(
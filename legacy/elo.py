@@ -1,28 +1,28 @@
 import pandas as pd
-from sklearn.linear_model import LogisticRegression
 from typing import List, Tuple
 
+from analysis.outcome_model import RoundOutcomeModel
+from analysis.leaderboard import Leaderboard
+
 import itertools
 
 import warnings
 warnings.filterwarnings("ignore")
 
-features = [
-    'roundDuration', 'damageDealt', 'damageDealtShields', 'damageDealtTempShields',
-    'damageDealtAuto', 'damageDealtPilot', 'damageDealtBlocked', 'critRateDealt',
-    'damageTaken', 'damageTakenShields', 'damageTakenTempShields', 'damageTakenAuto',
-    'damageTakenBlocked', 'critRateTaken', 'terminationDamage', 'coreFracEarned', 'coresUsed', 'batteriesPicked',
-    'batteriesToSelf', 'batteriesToAlly', 'batteriesToAllyPilot', 'shieldsGained', 'tempShieldsGained', 'healthWasted',
-    'shieldsWasted', 'timeAsTitan', 'timeAsPilot', 'avgDistanceToAllies', 'avgDistanceToCloseAlly',
-    'avgDistanceToEnemies', 'avgDistanceToCloseEnemy', 'avgDistanceToAlliesPilot', 'avgDistanceToCloseAllyPilot',
-    'avgDistanceToEnemiesPilot', 'avgDistanceToCloseEnemyPilot', 'distanceTravelled', 'distanceTravelledPilot',
-    'damageDealtSelf', 'kills', 'killsPilot', 'terminations'
-]
-
 
 class RankingSystem:
 
-    def __init__(self, games: pd.DataFrame, k: int, g: int = 1, min_matches: int = 15):
+    def __init__(
+            self, games: pd.DataFrame, k: int, g: int = 1, min_matches: int = 15, update_model: bool = False
+    ):
+        """
+        :param games:           the games to rank
+        :param k:               the k factor for the elo
+        :param g:               the g factor for the elo
+        :param min_matches:     players must have played more matches than this to be on the leaderboard
+        :param update_model:    train the persisted outcome model on games and save it, only set this
+                                when games is the full ranked history
+        """
 
         self.historical_rankings = pd.DataFrame()
         self.elo = pd.Series()
@@ -34,13 +34,16 @@ class RankingSystem:
 
         self.games = games
 
-        self.features = games[features].fillna(0.0)
-        self.result = games['result'].replace(["Loss", "Win"], [0, 1])
-
-        self.lr = LogisticRegression()
-        self.lr.fit(self.features, self.result)
+        self.model = RoundOutcomeModel.load()
+        if not self.model.is_fitted and not update_model:
+            print("no saved outcome model, training on games only, run python -m analysis.outcome_model to save one")
+        if update_model or not self.model.is_fitted:
+            self.model.update(games)
+        if update_model:
+            self.model.save()
 
         self.matches_played = pd.Series()
+        self.leaderboard = Leaderboard(min_matches=min_matches)
 
     def process_match(self, match: pd.DataFrame):
         """
@@ -58,6 +61,7 @@ class RankingSystem:
 
         match_played = pd.Series(1, index=match['name'].unique())
         self.matches_played = self.matches_played.add(match_played, fill_value=0)
+        self.leaderboard.add_matches(match_played.index)
 
         self.historical_rankings = pd.concat(
             [self.historical_rankings, self.elo.rename(len(self.historical_rankings.columns) + 1)],
@@ -78,13 +82,13 @@ class RankingSystem:
 
         elo_gained = pd.Series(0, index=game_round['name'].unique())
 
-        for winner, loser in list(itertools.product(winners.index.values, losers.index.values)):
+        prob_win = pd.Series(self.model.predict_proba(winners), index=winners.index)
+        prob_loss = 1 - pd.Series(self.model.predict_proba(losers), index=losers.index)
 
-            prob_win = self.lr.predict_proba(winners.loc[winner][features].values.reshape(-1, 1).T)[0][1]
-            prob_loss = self.lr.predict_proba(losers.loc[loser][features].values.reshape(-1, 1).T)[0][0]
+        for winner, loser in list(itertools.product(winners.index.values, losers.index.values)):
 
             win_gain, lose_loss = self.update_elo(
-                winner, loser, prob_win, prob_loss
+                winner, loser, prob_win[winner], prob_loss[loser]
             )
 
             elo_gained[winner] += win_gain
@@ -92,12 +96,16 @@ class RankingSystem:
 
         self.elo = self.elo.add(elo_gained, fill_value=0.0)
 
+        for player in elo_gained.index:
+            self.leaderboard.set_rating(player, self.elo[player])
+
     def check_player(self, player_id: str):
         """
         :param player_id: the player to add
         """
         if player_id not in self.elo.index:
             self.elo[player_id] = 1000
+            self.leaderboard.set_rating(player_id, 1000)
 
     def update_elo(self, winner_user_id: str, loser_user_id: str, prob_win: float, prob_loss: float):
         """
@@ -119,9 +127,7 @@ class RankingSystem:
         """
         :return: the current top 10 players
         """
-        top = self.elo[self.matches_played > self.min_matches].nlargest(10)
-
-        return top.copy()
+        return self.leaderboard.top(10)
 
     def get_player_elo(self, player_gt: str) -> float:
         """
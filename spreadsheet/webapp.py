@@ -4,9 +4,13 @@ from streamlit import session_state as state
 import streamlit as st
 from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, DataReturnMode, ColumnsAutoSizeMode
 
-from database.mongo import load_database
-from analysis.preprocess import preprocess
-from analysis.utilities import get_game_type
+from analysis.explorer import (
+    AGGREGATIONS, ROLLING_AGGREGATIONS, load_ranked_games, filter_games, aggregate_games, build_rolling_metrics,
+    refresh_rolling_metrics, rolling_games
+)
+from analysis.rolling import RollingMetrics
+from analysis.leaderboard import LEADERBOARD_PATH
+from analysis.pairings import Pairings, RELATIONS
 
 
 def page_setup() -> None:
@@ -33,15 +37,27 @@ def page_setup() -> None:
         )
 
 
+@st.cache(max_entries=1)
+def load_game_data(data_version: int) -> pd.DataFrame:
+    """
+    :param data_version:    incremented to reload the games from the database
+    :return:                all ranked games with the team size of each round
+    """
+    return load_ranked_games()
+
+
+def reload_games() -> None:
+    """
+    load the games played since the page was opened
+    """
+    state.data_version += 1
+
+
 def view_data() -> None:
     """
     view game data
     """
-    @st.cache
-    def load_game_data() -> pd.DataFrame:
-        return get_game_type(preprocess(load_database()))
-
-    ranked_games = load_game_data()
+    ranked_games = load_game_data(state.data_version)
 
     start_date, end_date = st.columns(2)
 
@@ -51,7 +67,8 @@ def view_data() -> None:
             "Start Date",
             start_query,
             key="start_date",
-            help="The start date of the query",
+            help="The start date of the query, not used by the last n rounds/days aggregations",
+            disabled="agg_func" in state and state.agg_func in ROLLING_AGGREGATIONS,
         )
     with end_date:
         st.date_input("End Date", key="end_date", help="The end date of the query")
@@ -75,30 +92,27 @@ def view_data() -> None:
     )
     st.selectbox(
         label="Aggregation Method",
-        options=["sum", "mean", "std", "max", "min"],
+        options=AGGREGATIONS + ROLLING_AGGREGATIONS,
         key="agg_func",
         help="sum = all values added together, mean = average per round, std = consistency (high = inconsistent)"
-             "max = the maximum value achieved, min = the minimum value achieved"
+             "max = the maximum value achieved, min = the minimum value achieved, "
+             "last n rounds/days = average over each group's most recent rounds/days before the end date "
+             "(the start date is not used)"
     )
 
     if not state.group_columns or not state.data_columns:
         st.stop()
 
-    ranked_games = ranked_games[
-        (ranked_games["matchTimestamp"] > state.start_date.strftime("%Y-%m-%d")) &
-        (ranked_games["matchTimestamp"] < state.end_date.strftime("%Y-%m-%d"))
-    ]
+    if state.agg_func in ROLLING_AGGREGATIONS:
+        view_rolling()
+        st.stop()
+
     if not state.match_type:
         st.write("please include a match type")
         st.stop()
 
-    ranked_games = ranked_games[ranked_games.team_size.isin(state.match_type)]
-
-    view_games = ranked_games.groupby(state.group_columns)[state.data_columns].agg(state.agg_func)
-    round_count = ranked_games.groupby(
-        state.group_columns).count()["team_size"].squeeze().astype(int).rename("rounds_played")
-    view_games = pd.concat([view_games, round_count], axis=1)
-    view_games = round(view_games, 2)
+    ranked_games = filter_games(ranked_games, state.start_date, state.end_date, state.match_type)
+    view_games = aggregate_games(ranked_games, state.group_columns, state.data_columns, state.agg_func)
 
     st.slider(
         label="Min Rounds Played",
@@ -109,11 +123,6 @@ def view_data() -> None:
         key="rounds_min"
     )
 
-    wins = ranked_games.groupby(state.group_columns)["result"].value_counts().loc[
-        ranked_games.groupby(
-            state.group_columns)["result"].value_counts().index.get_level_values(-1) == "Win"].droplevel(-1)
-    win_loss = round(wins.div(view_games["rounds_played"]), 2).rename("win_loss")
-    view_games = pd.concat([view_games, win_loss.fillna(0.0)], axis=1)
     view_games = view_games[view_games["rounds_played"] > state.rounds_min]
     view_games = view_games.reset_index()
 
@@ -123,7 +132,166 @@ def view_data() -> None:
     )
 
 
+def view_rolling() -> None:
+    """
+    view recent form, the average over each group's last n rounds or days
+    """
+    @st.cache(allow_output_mutation=True)
+    def load_rolling_metrics(group_columns: tuple, match_type: tuple) -> RollingMetrics:
+        return build_rolling_metrics(load_game_data(state.data_version), list(group_columns), list(match_type))
+
+    if not state.match_type:
+        st.write("please include a match type")
+        st.stop()
+
+    st.number_input(
+        label="Window Size",
+        value=50 if state.agg_func == "last n rounds" else 30,
+        min_value=1,
+        step=1,
+        key="window_size",
+        help="the number of rounds or days in the window"
+    )
+
+    rolling = load_rolling_metrics(tuple(state.group_columns), tuple(state.match_type))
+
+    # the rolling metrics outlive a reload, so only the newly played rounds are appended to them
+    refreshed_key = "rolling_version_{}_{}".format(state.group_columns, state.match_type)
+    if state.get(refreshed_key) != state.data_version:
+        refresh_rolling_metrics(rolling, load_game_data(state.data_version), state.match_type)
+        state[refreshed_key] = state.data_version
+
+    view_games = rolling_games(
+        rolling, state.agg_func, int(state.window_size), state.data_columns, state.end_date
+    )
+
+    st.slider(
+        label="Min Rounds Played",
+        value=0,
+        min_value=0,
+        max_value=int(view_games["rounds_played"].max()) if not view_games.empty else 0,
+        step=1,
+        key="rounds_min"
+    )
+
+    view_games = view_games[view_games["rounds_played"] > state.rounds_min]
+    view_games = view_games.reset_index()
+
+    AgGrid(
+        view_games,
+        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW
+    )
+
+
+def view_leaderboard() -> None:
+    """
+    view the live leaderboard, the file is written in rank order by the rating engine
+    """
+    try:
+        leaderboard = pd.read_csv(LEADERBOARD_PATH)
+    except FileNotFoundError:
+        st.write("no leaderboard has been saved yet")
+        st.stop()
+
+    leaderboard = leaderboard[leaderboard["rank"].notna()]
+    leaderboard = leaderboard.astype({"rank": int})
+    leaderboard = round(leaderboard, 2)
+
+    st.text_input(label="Find Player", key="leaderboard_player")
+
+    if state.leaderboard_player:
+        leaderboard = leaderboard[leaderboard["name"].str.contains(state.leaderboard_player, case=False, regex=False)]
+
+    AgGrid(
+        leaderboard,
+        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW
+    )
+
+
+def view_pairings() -> None:
+    """
+    view win/loss with teammates and against opponents for players and titans
+    """
+    @st.cache(allow_output_mutation=True)
+    def load_pairings(column: str) -> Pairings:
+        pairings = Pairings(column=column)
+        pairings.append(load_game_data(state.data_version))
+        return pairings
+
+    ranked_games = load_game_data(state.data_version)
+
+    start_date, end_date = st.columns(2)
+
+    with start_date:
+        st.date_input(
+            "Start Date",
+            datetime.datetime(2022, 1, 1),
+            key="pairings_start_date",
+            help="The start date of the query",
+        )
+    with end_date:
+        st.date_input("End Date", key="pairings_end_date", help="The end date of the query")
+
+    st.multiselect(
+        label="Filter Match Type",
+        options=sorted(ranked_games.team_size.unique()),
+        default=sorted(ranked_games.team_size.unique()),
+        key="pairings_match_type",
+        format_func=lambda match: f"{match}v{match}",
+    )
+    st.selectbox(
+        label="Pair",
+        options=["name", "titan"],
+        key="pairings_column",
+        format_func=lambda column: "players" if column == "name" else "titans",
+    )
+    st.selectbox(
+        label="Relation",
+        options=RELATIONS,
+        key="pairings_relation",
+        help="teammates = on the same team, opponents = on opposing teams, win_loss is for the first of the pair"
+    )
+
+    if not state.pairings_match_type:
+        st.write("please include a match type")
+        st.stop()
+
+    view_pairs = load_pairings(state.pairings_column).query(
+        state.pairings_relation, state.pairings_start_date, state.pairings_end_date, state.pairings_match_type
+    )
+
+    st.slider(
+        label="Min Rounds Played",
+        value=0,
+        min_value=0,
+        max_value=int(view_pairs["rounds_played"].max()) if not view_pairs.empty else 0,
+        step=1,
+        key="pairings_rounds_min"
+    )
+
+    view_pairs = view_pairs[view_pairs["rounds_played"] > state.pairings_rounds_min]
+
+    AgGrid(
+        view_pairs,
+        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW
+    )
+
+
 if __name__ == "__main__":
 
     page_setup()
-    view_data()
+
+    if "data_version" not in state:
+        state.data_version = 0
+
+    st.sidebar.radio(label="View", options=["Explorer", "Leaderboard", "Pairings"], key="view")
+    st.sidebar.button(
+        label="Reload Games", on_click=reload_games, help="load the games played since the page was opened"
+    )
+
+    if state.view == "Leaderboard":
+        view_leaderboard()
+    elif state.view == "Pairings":
+        view_pairings()
+    else:
+        view_data()